@@ -5,6 +5,8 @@
 # See LICENSE for details
 
 import math
+import operator
+import select
 import socket
 import sys
 import time
@@ -16,6 +18,9 @@ import numpy as np
 
 
 class Instrument:  # Everything is an instrument
+    connectTimeout = 5.0  # give up on an unreachable instrument well before the OS would
+    lineTimeout = 1.0  # how long getRsp waits for a line from a serial instrument
+    serialPoll = 0.05  # port timeout where a serial port can't be waited on with select, see bindSerial
 
     def __init__(self, isSerial, ip, serPort):
         self.isSerial = isSerial
@@ -23,7 +28,9 @@ class Instrument:  # Everything is an instrument
         self.serPort = serPort
         self.ser = serial.Serial()
 
-        self.ser.timeout = 1
+        self.ser.timeout = self.lineTimeout
+        self.rxbuf = bytearray()  # received but not yet consumed, see readUntil
+        self.rxchunk = bytearray(4096)  # socket reads land here, so no new bytes object per read
         self.connected = self.connect()
         self.lastResponse = ""
 
@@ -60,17 +67,68 @@ class Instrument:  # Everything is an instrument
             self.ser.open()
         except:
             return False
+        try:  # Linux only, and not every driver supports it (FTDI adapters otherwise batch for 16 ms)
+            self.ser.set_low_latency_mode(True)
+        except:
+            pass
+        self.bindSerial()
         return self.ser.is_open
 
     def connectEth(self):
         try:
             self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            # commands are short and each waits on its reply, so don't let Nagle hold them back
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            # set before connect so the window is advertised from the start; room for a whole scan burst
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 17)
             server_address = (self.ip, self.ipPort)
+            self.sock.settimeout(self.connectTimeout)
             self.sock.connect(server_address)
+            self.sock.settimeout(None)  # reads wait on select, see bindEth
         except:
             return False
+        self.bindEth()
         return True
 
+    # The port's read and write calls are chosen once here rather than testing isSerial on every call.
+    # They close over the port, not the instrument, so __del__ still runs as soon as the instrument is dropped.
+    def bindSerial(self):
+        ser = self.ser
+        self.write = ser.write
+
+        try:
+            fd = ser.fileno()  # POSIX only
+        except:
+            fd = None
+        if (fd is not None):
+            def readChunk(timeout):  # bulk read of whatever has arrived, sleeping up to timeout until something does
+                if (not ser.in_waiting and not select.select([fd], [], [], timeout)[0]):
+                    return b""
+                return ser.read(ser.in_waiting)
+        else:
+            # changing the timeout reconfigures the port, so set a short one once and
+            # leave readUntil to keep to its own deadline over repeated reads
+            ser.timeout = self.serialPoll
+
+            def readChunk(timeout):  # bulk read of whatever has arrived, waiting in the driver up to serialPoll
+                first = ser.read(max(1, ser.in_waiting))
+                return first + ser.read(ser.in_waiting) if first else first
+        self.readChunk = readChunk
+
+    def bindEth(self):
+        sock, chunk = self.sock, self.rxchunk
+
+        def readChunk(timeout):  # bulk read of whatever has arrived, sleeping up to timeout until something does
+            if (not select.select([sock], [], [], timeout)[0]):
+                return b""
+            n = sock.recv_into(chunk)
+            if (n == 0):
+                raise ConnectionError("connection closed by instrument")
+            return memoryview(chunk)[0:n]
+        self.write = sock.sendall
+        self.readRsp = lambda: sock.recv(4096)
+        self.readChunk = readChunk
+
     def disconnectSerial(self):
         try:
             self.ser.close()
@@ -83,43 +141,52 @@ class Instrument:  # Everything is an instrument
         except:
             pass
 
-    def sendCmd(self, cmd):
-        if (self.isSerial):
-            return self.sendCmdSerial(cmd + "\r\n")
-        else:
-            return self.sendCmdEth(cmd + "\r\n")
-
-    def getRsp(self):
-        if (self.isSerial):
-            return self.getRspSerial()
-        else:
-            return self.getRspEth()
-
-    def getRspEth(self):
+    def hangUpEth(self, bye):  # sends bye and waits until it has been flushed, rather than sleeping a fixed time
         try:
-            return self.sock.recv(4096).decode()
+            self.sock.send(bye)
+            self.sock.shutdown(socket.SHUT_WR)
+            # wait (briefly) for the instrument to hang up too, so close() can't reset the connection under it,
+            # but not for long, one that keeps streaming would otherwise hold the GUI here forever
+            deadline = time.monotonic()+0.5
+            while (time.monotonic() < deadline and select.select([self.sock], [], [], 0.05)[0] and self.sock.recv(4096)):
+                pass
         except:
-            self.connected = False
-            return ""
+            pass
 
-    def getRspSerial(self):
+    def sendCmd(self, cmd):  # cmd is a str, or bytes already encoded and terminated (see setCmds)
+        if (isinstance(cmd, str)):
+            cmd = cmd.encode('ascii') + b"\r\n"
         try:
-            return self.ser.readline().decode()
+            self.write(cmd)
         except:
             self.connected = False
-            return ""
 
-    def sendCmdSerial(self, cmd):
+    def getRsp(self):
+        if (self.isSerial):  # a line, drained in bulk rather than by pyserial's byte at a time readline
+            return self.readUntil(b"\n", self.lineTimeout)
         try:
-            self.ser.write(cmd.encode())
+            return self.readRsp().decode()
         except:
             self.connected = False
+            return ""
 
-    def sendCmdEth(self, cmd):
-        try:
-            self.sock.sendall(cmd.encode())
-        except:
-            self.connected = False
+    def readUntil(self, sentinel, timeout):  # returns the text before sentinel, anything after it stays buffered for the next call
+        pos = self.rxbuf.find(sentinel)
+        deadline = time.monotonic()+timeout
+        while (pos < 0 and time.monotonic() < deadline):
+            searched = max(0, len(self.rxbuf)-len(sentinel)+1)  # only the new tail needs scanning
+            try:
+                self.rxbuf += self.readChunk(max(0.0, deadline-time.monotonic()))
+            except:
+                self.connected = False
+                return ""
+            pos = self.rxbuf.find(sentinel, searched)
+        if (pos < 0):  # timed out, hand back whatever did arrive
+            pos = len(self.rxbuf)
+        with memoryview(self.rxbuf) as view:  # decode in place, once, rather than copying the slice first
+            rsp = str(view[0:pos], 'ascii', 'replace')
+        del self.rxbuf[0:pos+len(sentinel)]
+        return rsp
 
     def sendQuery(self, cmd):
         self.sendCmd(cmd)
@@ -129,38 +196,51 @@ class Instrument:  # Everything is an instrument
     def getFloat(self, cmd):
         return float(self.sendQuery(cmd))
 
-    def match(self, s, v):
-        return (s[0:len(v)] == v)
+    def match(self, s, v):  # v may be a tuple of alternatives
+        return s.startswith(v)
 
 
 class Classifier(Instrument):
+    isScanner = False  # a scanning classifier reports its points as the scan runs, so has no grid to precompute
 
     def __init__(self, isSerial, ip, serPort, start, end, perdec, flow, RorQsh):
         self.fileFields = [self.quantity]+self.valueFields
+        self.bypassData = dict.fromkeys(self.fileFields, "Bypassed")
         self.start = start
         self.end = end
         self.perdec = perdec
-        self.points = math.floor(
-            ((perdec)*(math.log10(end)-math.log10(start)))+0.00001)+1
         self.point = -1
         self.flow = flow
         self.RorQsh = RorQsh
 
         self.x = 0.0
-        self.X = np.zeros(self.points)
-        for i in range(self.points):
-            self.X[i] = self.getPoint(i)
+        self.sums = np.zeros(len(self.valueFields))  # running totals of valueFields, see monitor
+        self.ratio = 10.0**(1.0/self.perdec)  # between neighbouring setpoints
+        if (self.isScanner):
+            self.points = 0
+            self.X = np.zeros(0)
+        else:
+            self.points = math.floor(
+                ((perdec)*(math.log10(end)-math.log10(start)))+0.00001)+1
+            self.X = self.start*np.power(self.ratio, np.arange(self.points))
+        # the grid is sent every scan, so format and encode its commands once
+        self.setCmds = {x: self.floatCmd(self.sizeCommand, x).encode('ascii') + b"\r\n" for x in self.X}
         super().__init__(isSerial, ip, serPort)
         self.setRorQsh(RorQsh)
 
     def next(self):
-        self.values = {self.valueFields[i]: 0.0 for i in range(
-            len(self.valueFields))}
+        self.sums.fill(0.0)
         self.tally = 0
         self.point += 1
         self.x = self.X[self.point]
         return self.set(self.x)
 
+    def set(self, x):
+        cmd = self.setCmds.get(x)
+        if (cmd is None):
+            cmd = self.floatCmd(self.sizeCommand, x)
+        return self.sendAndCheck(cmd)
+
     def moreToCome(self):
         return (self.point+1 < self.points)
 
@@ -168,23 +248,22 @@ class Classifier(Instrument):
         self.point = -1
 
     def getPoint(self, p):
-        return self.start*((10.0**(1.0/self.perdec))**p)
+        return self.X[p]
 
     def monitor(self):  # gets the feedback values which we store in the file
         r = self.doMonitorCmd()
-        self.values = {self.valueFields[i]: (self.values[self.valueFields[i]]+float(
-            r[self.valueFields[i]])) for i in range(len(self.valueFields))}
+        self.sums += [float(r[field]) for field in self.valueFields]
         self.tally += 1
 
     def getFileData(self):
-        return {**{self.quantity: self.x}, **{self.valueFields[i]: (self.values[self.valueFields[i]]/float(self.tally)) for i in range(len(self.valueFields))}}
+        return {self.quantity: self.x, **dict(zip(self.valueFields, (self.sums/self.tally).tolist()))}
 
     def bypassDummy(self):
-        return {self.fileFields[i]: "Bypassed" for i in range(len(self.fileFields))}
+        return self.bypassData.copy()
 
     def doMonitorCmd(self):  # sends the command which gets the feedback values
         r = self.sendQuery(self.monitorCmd).split(self.monitorSep)
-        return {self.monitorFields[i]: r[i] for i in range(len(r))}
+        return dict(zip(self.monitorFields, r))
 
     def run(self):  # default for classifiers which don't "run or stop"
         return True
@@ -225,23 +304,20 @@ class CambustionClass(Classifier):
             self.ser.write(bytes([4]))
         return True
 
-    def getRsp(self):
-        chunks = ""
-        start = time.time()
-        while (chunks.find("\r\n>") < 0 and time.time()-start < self.timeout):
-            try:
-                if (self.isSerial):
-                    chunk = self.ser.read().decode()
-                else:
-                    chunk = self.sock.recv(1024).decode()
-            except:
-                self.connected = False
-                return ""
-            chunks += chunk
-        return chunks[0:chunks.find("\r\n>")].replace(">", "")
+    def sendQuery(self, cmd):  # getRsp returns as soon as the prompt arrives, so querydelay only extends its timeout
+        self.sendCmd(cmd)
+        return self.getRsp(self.querydelay+self.timeout)
+
+    def getRsp(self, timeout=None):
+        if (timeout is None):
+            timeout = self.timeout
+        return self.readUntil(b"\r\n>", timeout).replace(">", "")
+
+    def floatCmd(self, cmd, val):
+        return cmd + " " + "%0.4E" % val
 
     def sendFloat(self, cmd, val):
-        return (self.sendAndCheck(cmd + " " + "%0.4E" % val))
+        return (self.sendAndCheck(self.floatCmd(cmd, val)))
 
     def sendAndCheck(self, cmd):
         self.lastResponse = self.sendQuery(cmd)
@@ -263,21 +339,17 @@ class CambustionClass(Classifier):
         return (self.match(self.sendQuery("Status"), "Running"))
 
     def disconnectEth(self):
-        try:
-            self.sock.send(bytes([13, 10, 4]))  # ctrl-D
-            time.sleep(0.05)
-            super().disconnectEth()
-        except:
-            pass
+        self.hangUpEth(bytes([13, 10, 4]))  # ctrl-D
+        super().disconnectEth()
 
     def enableBypass(self, bypassChannel):
         # set analogue out to "fixed" mode
         self.sendAndCheck("SetAOFunc "+str(bypassChannel)+" 1")
-        return self.sendAndCheck("SetAOV "+str(bypassChannel)+" "+"%0.4E" % self.bypassVoltage)
+        return self.sendFloat("SetAOV "+str(bypassChannel), self.bypassVoltage)
 
     def disableBypass(self, bypassChannel):
         self.sendAndCheck("SetAOFunc "+str(bypassChannel)+" 1")
-        return self.sendAndCheck("SetAOV "+str(bypassChannel)+" "+"%0.4E" % self.noBypassVoltage)
+        return self.sendFloat("SetAOV "+str(bypassChannel), self.noBypassVoltage)
 
 
 class CPMA(CambustionClass):
@@ -288,15 +360,13 @@ class CPMA(CambustionClass):
                    "Pressure (Pa)", "Temperature (C)"]
     quantity = "Mp (fg)"
     label = "m*"
+    sizeCommand = "SetMass"
 
     def connect(self):
         if (not super().connect()):
             return False
         return (self.match(self.getRsp(), "Cambustion CPMA"))
 
-    def set(self, x):
-        return self.sendFloat("SetMass", x)
-
     def setRorQsh(self, Rm):
         self.Rm = Rm
         return self.sendFloat("SetRm", Rm)
@@ -320,18 +390,21 @@ class AAC(CambustionClass):
                    "Pressure (Pa)", "Temperature (C)"]
     quantity = "Da (nm)"
     label = "da*"
+    sizeCommand = "SetSize"
     isScanning = False
     mtc = False
+    # scan line columns: Da, concentration, then the valueFields in order
+    scanColumns = operator.itemgetter(2, 14, 16, 17, 19, 18)
 
     def __init__(self, isSerial, ip, serPort, start, end, perdec, flow, RorQsh, ScanUpTime, resAve, delayTime, PreFactor, Exponent, f_lower, f_upper, IsWater, IsSoot, IsNone, variableBins, isScanner):
+        self.isScanner = isScanner  # set first, so Classifier skips building a grid
         super().__init__(isSerial, ip, serPort, start, end, perdec, flow, RorQsh)
-        self.isScanner = isScanner
         if (isScanner):
             self.resAve = resAve
             self.delayTime = delayTime
             self.ScanUpTime = ScanUpTime
-            self.X = np.zeros(0)
-            self.points = 0
+            self.scanX = np.zeros(64)  # grown by doubling, X is a view of the points received so far
+            self.X = self.scanX[0:0]
             self.conc = 0.0
         self.variableBins = variableBins
         self.IsWater = IsWater
@@ -376,35 +449,18 @@ class AAC(CambustionClass):
             return False
         return (self.match(self.getRsp(), "Cambustion AAC"))
 
-    def set(self, x):
-        return self.sendFloat("SetSize", x)
-
     def setRorQsh(self, Qsh):
         self.Qsh = Qsh
         return self.sendFloat("SetSheath", Qsh)
 
     def getLine(self):
-        start = time.time()
-        while (self.scanchunks.find("\r\n") < 0 and time.time()-start < 100):
-            try:
-                if (self.isSerial):
-                    chunk = self.ser.read().decode()
-                else:
-                    chunk = self.sock.recv(1024).decode()
-            except:
-                self.connected = False
-                return ""
-            self.scanchunks += chunk
-        pos = self.scanchunks.find("\r\n")
-        line = self.scanchunks[0:pos]
-        self.scanchunks = self.scanchunks[pos+2:]
-        return line
+        return self.readUntil(b"\r\n", 100)
 
     def StartScan(self):
 
         self.sendCmd("SassScan s %d" % self.ScanUpTime + " %0.4E" % self.start+" %0.4E" %
                      self.end + " %0.4E" % self.RorQsh+" %0.4E" % self.delayTime+" %0.4E" % self.resAve+" u 1")
-        self.scanchunks = ""
+        self.rxbuf.clear()
         while True:
             dummy = self.getLine()
             if (not self.match(dummy, "Cambustion")):
@@ -418,10 +474,10 @@ class AAC(CambustionClass):
 
     def StopScan(self):
         self.isScanning = False
-        if (self.isSerial):
-            self.ser.write(bytes([3, 13, 10]))  # ctrl-C
-        else:
-            self.sock.send(bytes([3, 13, 10]))  # ctrl-C
+        try:
+            self.write(bytes([3, 13, 10]))  # ctrl-C
+        except:
+            self.connected = False
 
     def run(self):
         if (self.isScanner):
@@ -451,8 +507,7 @@ class AAC(CambustionClass):
     def next(self):
         if (not self.isScanner):
             return super().next()
-        self.values = {self.valueFields[i]: 0.0 for i in range(
-            len(self.valueFields))}
+        self.sums.fill(0.0)
         if (not self.isScanning):
             self.tally = 1
             return True
@@ -466,18 +521,15 @@ class AAC(CambustionClass):
             self.isScanning = False
             self.mtc = False
             return False
-        self.x = float(aacfileline[2])
+        self.x, self.conc, *feedback = map(float, self.scanColumns(aacfileline))
         self.point += 1
         if (self.point >= self.points):
             self.points += 1
-            self.X.resize(self.points)
+            if (self.points > self.scanX.size):
+                self.scanX = np.resize(self.scanX, 2*self.scanX.size)
+            self.X = self.scanX[0:self.points]
         self.X[self.point] = self.x
-        self.values[self.quantity] = self.x
-        self.conc = float(aacfileline[14])
-        self.values["Speed (rad/s)"] = float(aacfileline[16])
-        self.values["Sheath flow (lpm)"] = float(aacfileline[17])
-        self.values["Pressure (Pa)"] = float(aacfileline[19])
-        self.values["Temperature (C)"] = float(aacfileline[18])
+        self.sums[:] = feedback
         return True
 
     def moreToCome(self):
@@ -510,16 +562,16 @@ class TSIDma(Classifier):
         self.lastResponse = self.sendQuery(cmd)
         return (not self.match(self.lastResponse, "ERROR"))
 
+    def floatCmd(self, cmd, val):
+        return cmd + "%0.1F" % val
+
     def sendFloat(self, cmd, val):
-        return (self.sendAndCheck(cmd + "%0.1F" % val))
+        return (self.sendAndCheck(self.floatCmd(cmd, val)))
 
     def setRorQsh(self, Qsh):
         self.Qsh = Qsh
         return self.sendFloat(self.sheathCommand, Qsh)
 
-    def set(self, x):
-        return self.sendFloat(self.sizeCommand, x)
-
 
 class TSI3080(TSIDma):
     baudrate = 9600
@@ -537,7 +589,7 @@ class TSI3080(TSIDma):
 
     def isReady(self):
         r = self.sendQuery("RFL")
-        return (self.match(r, "1,1,1") or self.match(r, "1,0,1"))
+        return self.match(r, ("1,1,1", "1,0,1"))
 
     def getHeader(self):
         header = {}
@@ -552,6 +604,17 @@ class TSI3080(TSIDma):
 
 class TSI3082(TSIDma):
     ipPort = 3602
+    # 3082 size bins (nm), indexed by the WSLOWERSIZE / WSUPPERSIZE commands
+    TSIsetPoints = np.array([1.02, 1.06, 1.09, 1.13, 1.18, 1.22, 1.26, 1.31, 1.36, 1.41, 1.46, 1.51, 1.57, 1.63, 1.68, 1.75, 1.81, 1.88,
+                             1.95, 2.02, 2.09, 2.17, 2.25, 2.33, 2.41, 2.5, 2.59, 2.69, 2.79, 2.89, 3, 3.11, 3.22, 3.34, 3.46, 3.59, 3.72,
+                             3.85, 4, 4.14, 4.29, 4.45, 4.61, 4.78, 4.96, 5.14, 5.33, 5.52, 5.73, 5.94, 6.15, 6.38, 6.61, 6.85, 7.1, 7.37,
+                             7.64, 7.91, 8.2, 8.51, 8.82, 9.14, 9.47, 9.82, 10.2, 10.6, 10.9, 11.3, 11.8, 12.2, 12.6, 13.1, 13.6, 14.1,
+                             14.6, 15.1, 15.7, 16.3, 16.8, 17.5, 18.1, 18.8, 19.5, 20.2, 20.9, 21.7, 22.5, 23.3, 24.1, 25, 25.9, 26.9,
+                             27.9, 28.9, 30, 31.1, 32.2, 33.4, 34.6, 35.9, 37.2, 38.5, 40, 41.4, 42.9, 44.5, 46.1, 47.8, 49.6, 51.4, 53.3,
+                             55.2, 57.3, 59.4, 61.5, 63.8, 66.1, 68.5, 71, 73.7, 76.4, 79.1, 82, 85.1, 88.2, 91.4, 94.7, 98.2, 102, 106,
+                             109, 113, 118, 122, 126, 131, 136, 141, 146, 151, 157, 163, 168, 175, 181, 188, 195, 202, 209, 217, 225, 233,
+                             241, 250, 259, 269, 279, 289, 300, 311, 322, 334, 346, 359, 372, 385, 400, 414, 429, 445, 461, 478, 496, 514,
+                             533, 552, 573, 594, 615, 638, 661, 685, 710, 737, 764, 791, 820, 851, 882, 914, 947, 982])
 
     def __init__(self, isSerial, ip, serPort, start, end, perdec, flow, RorQsh, HighFlow, Polarity, ScanUpTime, LowerRange, UpperRange, PreFactor, Exponent, f_lower, f_upper, IsWater, IsSoot, IsNone, variableBins, isScanner):
         super().__init__(isSerial, ip, serPort, start, end, perdec, flow, RorQsh)
@@ -662,17 +725,12 @@ class TSI3082(TSIDma):
         dmStar = pow((mStar * (10 ** -18)) / K, 1 / Dm) * (10 ** 9)
         Lower = pow(dmStar, self.f_lower)
         Upper = pow(dmStar, self.f_upper)
-        TSIsetPoints = [1.02, 1.06, 1.09, 1.13, 1.18, 1.22, 1.26, 1.31, 1.36, 1.41, 1.46, 1.51, 1.57, 1.63, 1.68, 1.75, 1.81, 1.88, 1.95, 2.02, 2.09, 2.17, 2.25, 2.33, 2.41, 2.5, 2.59, 2.69, 2.79, 2.89, 3, 3.11, 3.22, 3.34, 3.46, 3.59, 3.72,
-                        3.85, 4, 4.14, 4.29, 4.45, 4.61, 4.78, 4.96, 5.14, 5.33, 5.52, 5.73, 5.94, 6.15, 6.38, 6.61, 6.85, 7.1, 7.37, 7.64, 7.91, 8.2, 8.51, 8.82, 9.14, 9.47, 9.82, 10.2, 10.6, 10.9, 11.3, 11.8, 12.2, 12.6, 13.1, 13.6, 14.1,
-                        14.6, 15.1, 15.7, 16.3, 16.8, 17.5, 18.1, 18.8, 19.5, 20.2, 20.9, 21.7, 22.5, 23.3, 24.1, 25, 25.9, 26.9, 27.9, 28.9, 30, 31.1, 32.2, 33.4, 34.6, 35.9, 37.2, 38.5, 40, 41.4, 42.9, 44.5, 46.1, 47.8, 49.6, 51.4, 53.3, 55.2,
-                        57.3, 59.4, 61.5, 63.8, 66.1, 68.5, 71, 73.7, 76.4, 79.1, 82, 85.1, 88.2, 91.4, 94.7, 98.2, 102, 106, 109, 113, 118, 122, 126, 131, 136, 141, 146, 151, 157, 163, 168, 175, 181, 188, 195, 202, 209, 217, 225, 233, 241,
-                        250, 259, 269, 279, 289, 300, 311, 322, 334, 346, 359, 372, 385, 400, 414, 429, 445, 461, 478, 496, 514, 533, 552, 573, 594, 615, 638, 661, 685, 710, 737, 764, 791, 820, 851, 882, 914, 947, 982]
-        LowerIndices = [i for i, value in enumerate(
-            TSIsetPoints) if value <= Lower]
-        LowerIndices = max(LowerIndices)
-        UpperIndices = [i for i, value in enumerate(
-            TSIsetPoints) if value < Upper]
-        UpperIndices = max(UpperIndices) + 1
+        # last bin at or below Lower, and one past the last bin below Upper
+        LowerIndices = int(np.searchsorted(self.TSIsetPoints, Lower, side='right')) - 1
+        UpperIndices = int(np.searchsorted(self.TSIsetPoints, Upper, side='left'))
+        if (LowerIndices < 0 or UpperIndices <= LowerIndices):  # Lower below the first bin, or an empty range
+            self.lastResponse = "size range %0.3g - %0.3g nm outside the 3082 bins" % (Lower, Upper)
+            return False
         return self.sendFloat("WSLOWERSIZE ", LowerIndices) and self.sendFloat("WSUPPERSIZE ", UpperIndices)
 
     def LowerSizeRange(self):
@@ -724,11 +782,8 @@ class TSI3082(TSIDma):
 
         return (abs((ss-sm)/ss) < self.tolerance and abs((vs-vm)/vs) < self.tolerance)
 
-    def doMonitorCmd(self):
-        output = self.monitorCmds.copy()
-        for key, cmd in self.monitorCmds.items():
-            output[key] = self.sendQuery(cmd)
-        return output
+    def doMonitorCmd(self):  # one query at a time: its replies have no end marker to frame them by, see sendQuery
+        return {key: self.sendQuery(cmd) for key, cmd in self.monitorCmds.items()}
 
     def getHeader(self):  # 3
         header = {}
@@ -791,20 +846,14 @@ class CambustionCPC(CPC):
             self.ser.write(bytes([4]))
         return (self.match(self.getRsp(), "Cambustion CPC"))
 
-    def getRsp(self):
-        chunks = ""
-        start = time.time()
-        while (chunks.find("\r\n>") < 0 and time.time()-start < self.timeout):
-            try:
-                if (self.isSerial):
-                    chunk = self.ser.read().decode()
-                else:
-                    chunk = self.sock.recv(1024).decode()
-            except:
-                self.connected = False
-                return ""
-            chunks += chunk
-        return chunks[0:chunks.find("\r\n>")].replace(">", "")
+    def sendQuery(self, cmd):  # getRsp returns as soon as the prompt arrives, so querydelay only extends its timeout
+        self.sendCmd(cmd)
+        return self.getRsp(self.querydelay+self.timeout)
+
+    def getRsp(self, timeout=None):
+        if (timeout is None):
+            timeout = self.timeout
+        return self.readUntil(b"\r\n>", timeout).replace(">", "")
 
     def sendFloat(self, cmd, val):
         return (self.sendAndCheck(cmd + " " + "%0.4E" % val))
@@ -814,12 +863,8 @@ class CambustionCPC(CPC):
         return (self.match(self.lastResponse, "OK"))
 
     def disconnectEth(self):
-        try:
-            self.sock.send(bytes([13, 10, 4]))  # ctrl-D
-            time.sleep(0.05)
-            super().disconnectEth()
-        except:
-            pass
+        self.hangUpEth(bytes([13, 10, 4]))  # ctrl-D
+        super().disconnectEth()
         
     def conc(self):
         return float(self.sendQuery("GCS"))
@@ -880,10 +925,10 @@ class Arduino(Instrument):
 
     def enableBypass(self):
         if (self.connected):
-            self.sendCmdSerial("on")
+            self.sendCmd(b"on")  # bytes, so sendCmd adds no line ending
         return
 
     def disableBypass(self):
         if (self.connected):
-            self.sendCmdSerial("off")
+            self.sendCmd(b"off")
         return
@@ -4,14 +4,13 @@
 # Original Authors: Jonathan Symonds, Morteza Kiasadegh, Tim Sipkens
 # See LICENSE for details
 
-from PyQt5 import QtWidgets
-from matplotlib.pyplot import Figure
+from PyQt5 import QtCore, QtGui, QtWidgets
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as Canvas
 import matplotlib
-import matplotlib.pyplot as plt
 from matplotlib.figure import Figure
+import numpy as np
 
-# Ensure using PyQt5 backend
+# Ensure using PyQt5 backend. Nothing here needs pyplot, so this only records the choice
 matplotlib.use('QT5Agg')
 
 # Matplotlib canvas class to create figure
@@ -19,13 +18,75 @@ matplotlib.use('QT5Agg')
 
 class MplCanvas(Canvas):
     def __init__(self):
-        self.fig = Figure()
-        self.fig.tight_layout()
+        # constrained layout is solved at draw time, once the labels and legends exist
+        self.fig = Figure(layout='constrained')
         self.ax = self.fig.add_subplot(111)
         Canvas.__init__(self, self.fig)
         Canvas.setSizePolicy(
             self, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding)
         Canvas.updateGeometry(self)
+        # the Agg buffer covers every pixel, so skip Qt's background fill before each paint
+        self.setAttribute(QtCore.Qt.WA_OpaquePaintEvent, True)
+        self.setAttribute(QtCore.Qt.WA_NoSystemBackground, True)
+        self.setAutoFillBackground(False)
+        self.aggImage = None  # QImage over the Agg buffer, valid while the renderer lives
+        self.aggImageRenderer = None
+        self.background = None  # figure without its animated lines, for blitting
+        self.drawCid = None  # draw_event hook, only connected once a line is blitted
+
+    def onDraw(self, event):  # a full draw leaves animated lines out, grab it then add them
+        self.background = self.copy_from_bbox(self.fig.bbox)
+        for ax in self.fig.axes:
+            for line in ax.lines:
+                if line.get_animated():
+                    ax.draw_artist(line)
+
+    # Change the data of a line and repaint just its axes, as long as the data still fits
+    # the current limits. Otherwise rescale and fall back to a full draw.
+    def updateLine(self, line, x, y):
+        line.set_data(x, y)
+        ax = line.axes
+        xlo, xhi = ax.get_xlim()
+        ylo, yhi = ax.get_ylim()
+        if (not line.get_animated() or self.background is None
+                or np.nanmin(x) < xlo or np.nanmax(x) > xhi or np.nanmin(y) < ylo or np.nanmax(y) > yhi):
+            line.set_animated(True)
+            if (self.drawCid is None):
+                self.drawCid = self.mpl_connect('draw_event', self.onDraw)
+            ax.relim()
+            ax.autoscale_view()
+            self.draw_idle()
+            return
+        self.restore_region(self.background)
+        ax.draw_artist(line)
+        self.blit(ax.bbox)
+
+    # Qt repaints on focus changes, overlapping windows etc. without anything to re-render.
+    # Paint the damaged rect straight out of the Agg buffer rather than copying it out and
+    # erasing the widget first as FigureCanvasQTAgg does on every paint event.
+    def paintEvent(self, event):
+        self._draw_idle()  # only renders if a draw is pending
+        renderer = getattr(self, 'renderer', None)
+        if renderer is None:  # nothing drawn yet, and Qt has not filled the background
+            painter = QtGui.QPainter(self)
+            painter.eraseRect(event.rect())
+            painter.end()
+            return
+        if self.aggImageRenderer is not renderer:  # new renderer after a resize or dpi change
+            self.aggBuf = renderer.buffer_rgba()  # QImage does not keep the buffer alive
+            self.aggImage = QtGui.QImage(self.aggBuf, self.aggBuf.shape[1], self.aggBuf.shape[0],
+                                         self.aggBuf.strides[0], QtGui.QImage.Format_RGBA8888)
+            self.aggImageRenderer = renderer
+        rect = event.rect()
+        ratio = self.device_pixel_ratio
+        painter = QtGui.QPainter(self)
+        try:
+            painter.drawImage(QtCore.QRectF(rect), self.aggImage,
+                              QtCore.QRectF(rect.left()*ratio, rect.top()*ratio,
+                                            rect.width()*ratio, rect.height()*ratio))
+            self._draw_rect_callback(painter)  # zoom rubberband
+        finally:
+            painter.end()
 
 # Matplotlib widget
 
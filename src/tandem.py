@@ -5,7 +5,7 @@
 # See LICENSE for details
 
 from PyQt5 import QtWidgets, uic
-from PyQt5.QtCore import QTimer, Qt, QSettings
+from PyQt5.QtCore import QTimer, Qt, QSettings, QObject, QRunnable, QThreadPool, pyqtSignal
 from PyQt5.uic import loadUi
 import sys
 import instruments
@@ -17,17 +17,50 @@ import csv
 import platform
 import ctypes
 import os
-import matplotlib.pyplot as plt
 from matplotlib.ticker import ScalarFormatter
 import matplotlib.colors as mcolors
 import matplotlib as mpl
 
 
 version = "0.2"
+pollInterval = 100  # ms between readiness queries while an instrument is stabilising
+cpcTypes = {  # CPC list entries and the instrument classes that drive them
+    "Cambustion 5210": instruments.CambustionCPC,
+    "3022/25": instruments.TSI30xx,
+    "3775/76": instruments.TSI377x,
+    "375x": instruments.TSI375x,
+    "Dummy": instruments.DummyCPC,
+    "Magic": instruments.MagicCpc,
+}
 
 app = QtWidgets.QApplication(sys.argv)
 
 
+class CpcProbeSignals(QObject):  # lives on the GUI thread, so the probe's results are delivered there
+    conc = pyqtSignal(object)
+    failed = pyqtSignal()
+    done = pyqtSignal()
+
+
+class CpcProbe(QRunnable):  # connects to a CPC and reads one concentration, off the GUI thread
+    def __init__(self, cpcType, isSerial, ip, serPort):
+        super().__init__()
+        self.signals = CpcProbeSignals()
+        self.cpcType = cpcType
+        self.args = (isSerial, ip, serPort)
+
+    def run(self):
+        try:
+            cpc = self.cpcType(*self.args)
+            if (not cpc.connected):
+                self.signals.failed.emit()
+                return
+            self.signals.conc.emit(cpc.conc())
+            cpc.disconnect()
+        finally:
+            self.signals.done.emit()
+
+
 class Ui(QtWidgets.QMainWindow):  # main GUI object
     def __init__(self):
         super(Ui, self).__init__()
@@ -40,161 +73,178 @@ class Ui(QtWidgets.QMainWindow):  # main GUI object
         self.setWindowFlags(self.windowFlags() |
                             Qt.MSWindowsFixedSizeDialogHint)
         self.settings = QSettings("Cambustion", "Tandem")
+        self.storedSettings = {}  # values as read from self.settings, so each key is read once
+        self.cpcProbe = None  # signals of the CPC test in progress, if any
         self.getSettings()
         self.graph = self.plotWidget.canvas.ax
         self.plot = self.MplWidget.canvas.ax
         self.plot_live = self.MplWidget_live.canvas.ax
+        self.plot2 = self.plot.twinx()
+        self.setupAxes()
+        self.fig = self.graph.get_figure()  # Get the Figure object
+        self.isScanning = False
+        self.show()
+
+    def setupAxes(self):  # scales and default labels, after creation or clearing
         self.plot_live.set_xscale('log')
         self.plot_live.set_xlabel('Second Classifier setpoints')
         self.plot_live.set_ylabel('Particle Concentration [Counts]')
         self.plot.set_xscale('log')
         self.plot.set_xlabel('Second Classifier setpoints')
         self.plot.set_ylabel('Particle Concentration [Counts]')
-        self.plot2 = self.plot.twinx()
         self.plot2.set_ylabel('Bypass Particle Concentration [Counts]')
         self.graph.set_yscale('log')
         self.graph.set_xscale('log')
         self.graph.set_xlabel('First Classifier')
         self.graph.set_ylabel('Second Classifier')
-        self.fig = self.graph.get_figure()  # Get the Figure object
-        self.isScanning = False
-        self.show()
+
+    def storedSetting(self, key, default, type=str):
+        if key not in self.storedSettings:
+            self.storedSettings[key] = self.settings.value(key, default, type=type)
+        return self.storedSettings[key]
+
+    def storeSetting(self, key, value):  # skip the write if the stored value is unchanged
+        if self.storedSettings.get(key) != value:
+            self.settings.setValue(key, value)
+            self.storedSettings[key] = value
 
     def getSettings(self):
         self.actionSave_Settings_on_Exit.setChecked(
-            self.settings.value("autoSaveSettings", False, type=bool))
+            self.storedSetting("autoSaveSettings", False, type=bool))
 
         self.firstClassifierList.setCurrentRow(
-            self.settings.value("first/Classifier", 0, type=int))
+            self.storedSetting("first/Classifier", 0, type=int))
         self.firstIsEth.setChecked(
-            self.settings.value("first/IsEth", True, type=bool))
+            self.storedSetting("first/IsEth", True, type=bool))
         self.firstIsSerial.setChecked(
-            not self.settings.value("first/IsEth", True, type=bool))
+            not self.storedSetting("first/IsEth", True, type=bool))
         self.firstIP.setPlainText(
-            self.settings.value("first/IP", "192.168.1.2"))
-        self.firstPort.setPlainText(self.settings.value("first/Port", "1"))
-        self.firstQa.setPlainText(self.settings.value("first/Qa", "1.5"))
+            self.storedSetting("first/IP", "192.168.1.2"))
+        self.firstPort.setPlainText(self.storedSetting("first/Port", "1"))
+        self.firstQa.setPlainText(self.storedSetting("first/Qa", "1.5"))
         self.firstRorQsh.setPlainText(
-            self.settings.value("first/RorQsh", "15.0"))
-        self.firstFrom.setPlainText(self.settings.value("first/From", "200.0"))
-        self.firstTo.setPlainText(self.settings.value("first/To", "1000.0"))
+            self.storedSetting("first/RorQsh", "15.0"))
+        self.firstFrom.setPlainText(self.storedSetting("first/From", "200.0"))
+        self.firstTo.setPlainText(self.storedSetting("first/To", "1000.0"))
         self.firstPerDecade.setPlainText(
-            self.settings.value("first/PerDecade", "16"))
-        self.firstDelay.setPlainText(self.settings.value("first/Delay", "2.0"))
+            self.storedSetting("first/PerDecade", "16"))
+        self.firstDelay.setPlainText(self.storedSetting("first/Delay", "2.0"))
         self.firstPolarity.setChecked(
-            self.settings.value("first/Polarity", True, type=bool))
+            self.storedSetting("first/Polarity", True, type=bool))
 
         self.secondClassifierList.setCurrentRow(
-            self.settings.value("second/Classifier", 1, type=int))
+            self.storedSetting("second/Classifier", 1, type=int))
         self.secondIsEth.setChecked(
-            self.settings.value("second/IsEth", True, type=bool))
+            self.storedSetting("second/IsEth", True, type=bool))
         self.secondIsSerial.setChecked(
-            not self.settings.value("second/IsEth", True, type=bool))
+            not self.storedSetting("second/IsEth", True, type=bool))
         self.secondIP.setPlainText(
-            self.settings.value("second/IP", "192.168.1.3"))
-        self.secondPort.setPlainText(self.settings.value("second/Port", "2"))
-        self.secondQa.setPlainText(self.settings.value("second/Qa", "1.5"))
+            self.storedSetting("second/IP", "192.168.1.3"))
+        self.secondPort.setPlainText(self.storedSetting("second/Port", "2"))
+        self.secondQa.setPlainText(self.storedSetting("second/Qa", "1.5"))
         self.secondRorQsh.setPlainText(
-            self.settings.value("second/RorQsh", "10.0"))
+            self.storedSetting("second/RorQsh", "10.0"))
         self.secondFrom.setPlainText(
-            self.settings.value("second/From", "200.0"))
-        self.secondTo.setPlainText(self.settings.value("second/To", "1000.0"))
+            self.storedSetting("second/From", "200.0"))
+        self.secondTo.setPlainText(self.storedSetting("second/To", "1000.0"))
         self.secondPerDecade.setPlainText(
-            self.settings.value("second/PerDecade", "16"))
+            self.storedSetting("second/PerDecade", "16"))
         self.secondScanner.setChecked(
-            self.settings.value("second/Scanner", False, type=bool))
-        self.Bypass.setChecked(self.settings.value(
+            self.storedSetting("second/Scanner", False, type=bool))
+        self.Bypass.setChecked(self.storedSetting(
             "second/doBypass", False, type=bool))
         self.secondDelay.setPlainText(
-            self.settings.value("second/Delay", "2.0"))
+            self.storedSetting("second/Delay", "2.0"))
         self.secondHighFlow.setChecked(
-            self.settings.value("second/HighFlow", True, type=bool))
+            self.storedSetting("second/HighFlow", True, type=bool))
         self.secondLowFlow.setChecked(
-            not self.settings.value("second/HighFlow", True, type=bool))
+            not self.storedSetting("second/HighFlow", True, type=bool))
         self.secondPolarity.setChecked(
-            self.settings.value("second/Polarity", True, type=bool))
+            self.storedSetting("second/Polarity", True, type=bool))
         self.secondScanUpTime.setPlainText(
-            self.settings.value("second/ScanUpTime", "240"))
+            self.storedSetting("second/ScanUpTime", "240"))
         self.secondLowerRange.setCurrentIndex(
-            self.settings.value("second/LowerRange", 0, type=int))
+            self.storedSetting("second/LowerRange", 0, type=int))
         self.secondUpperRange.setCurrentIndex(
-            self.settings.value("second/UpperRange", 191, type=int))
+            self.storedSetting("second/UpperRange", 191, type=int))
 
         self.scanDelay.setPlainText(
-            self.settings.value("second/ScanDelay", "8.0"))
-        self.scanAve.setPlainText(self.settings.value("second/ScanAve", "4"))
+            self.storedSetting("second/ScanDelay", "8.0"))
+        self.scanAve.setPlainText(self.storedSetting("second/ScanAve", "4"))
 
         self.cpcList.setCurrentRow(
-            self.settings.value("cpc/Type", 1, type=int))
-        self.cpcIP.setPlainText(self.settings.value("cpc/IP", "192.168.1.4"))
+            self.storedSetting("cpc/Type", 1, type=int))
+        self.cpcIP.setPlainText(self.storedSetting("cpc/IP", "192.168.1.4"))
         self.cpcIsEth.setChecked(
-            self.settings.value("cpc/IsEth", False, type=bool))
+            self.storedSetting("cpc/IsEth", False, type=bool))
         self.cpcIsSerial.setChecked(
-            not self.settings.value("cpc/IsEth", False, type=bool))
-        self.cpcPort.setPlainText(self.settings.value("cpc/Port", "3"))
-        self.average.setPlainText(self.settings.value("average", "1"))
+            not self.storedSetting("cpc/IsEth", False, type=bool))
+        self.cpcPort.setPlainText(self.storedSetting("cpc/Port", "3"))
+        self.average.setPlainText(self.storedSetting("average", "1"))
 
-        self.fileName = self.settings.value("RawFile", "../data/RawData.txt")
-        self.rawFileDisplay.setText("Raw Data File: "+self.fileName)
+        self.fileName = self.storedSetting("RawFile", "../data/RawData.txt")
+        self.rawFileDisplay.setText(f"Raw Data File: {self.fileName}")
 
     def saveSettings(self):
-        self.settings.setValue(
+        self.storeSetting(
             "autoSaveSettings", self.actionSave_Settings_on_Exit.isChecked())
 
-        self.settings.setValue(
+        self.storeSetting(
             "first/Classifier", self.firstClassifierList.currentRow())
-        self.settings.setValue("first/IsEth", self.firstIsEth.isChecked())
-        self.settings.setValue("first/IP", self.firstIP.toPlainText())
-        self.settings.setValue("first/Port", self.firstPort.toPlainText())
-        self.settings.setValue("first/Qa", self.firstQa.toPlainText())
-        self.settings.setValue("first/RorQsh", self.firstRorQsh.toPlainText())
-        self.settings.setValue("first/From", self.firstFrom.toPlainText())
-        self.settings.setValue("first/To", self.firstTo.toPlainText())
-        self.settings.setValue(
+        self.storeSetting("first/IsEth", self.firstIsEth.isChecked())
+        self.storeSetting("first/IP", self.firstIP.toPlainText())
+        self.storeSetting("first/Port", self.firstPort.toPlainText())
+        self.storeSetting("first/Qa", self.firstQa.toPlainText())
+        self.storeSetting("first/RorQsh", self.firstRorQsh.toPlainText())
+        self.storeSetting("first/From", self.firstFrom.toPlainText())
+        self.storeSetting("first/To", self.firstTo.toPlainText())
+        self.storeSetting(
             "first/PerDecade", self.firstPerDecade.toPlainText())
-        self.settings.setValue("first/Delay", self.firstDelay.toPlainText())
+        self.storeSetting("first/Delay", self.firstDelay.toPlainText())
 
-        self.settings.setValue(
+        self.storeSetting(
             "first/Polarity", self.firstPolarity.isChecked())
 
-        self.settings.setValue("second/Classifier",
+        self.storeSetting("second/Classifier",
                                self.secondClassifierList.currentRow())
-        self.settings.setValue("second/IsEth", self.secondIsEth.isChecked())
-        self.settings.setValue("second/IP", self.secondIP.toPlainText())
-        self.settings.setValue("second/Port", self.secondPort.toPlainText())
-        self.settings.setValue("second/Qa", self.secondQa.toPlainText())
-        self.settings.setValue(
+        self.storeSetting("second/IsEth", self.secondIsEth.isChecked())
+        self.storeSetting("second/IP", self.secondIP.toPlainText())
+        self.storeSetting("second/Port", self.secondPort.toPlainText())
+        self.storeSetting("second/Qa", self.secondQa.toPlainText())
+        self.storeSetting(
             "second/RorQsh", self.secondRorQsh.toPlainText())
-        self.settings.setValue("second/From", self.secondFrom.toPlainText())
-        self.settings.setValue("second/To", self.secondTo.toPlainText())
-        self.settings.setValue(
+        self.storeSetting("second/From", self.secondFrom.toPlainText())
+        self.storeSetting("second/To", self.secondTo.toPlainText())
+        self.storeSetting(
             "second/PerDecade", self.secondPerDecade.toPlainText())
-        self.settings.setValue(
+        self.storeSetting(
             "second/Scanner", self.secondScanner.isChecked())
-        self.settings.setValue("second/doBypass", self.Bypass.isChecked())
-        self.settings.setValue("second/Delay", self.secondDelay.toPlainText())
-        self.settings.setValue(
+        self.storeSetting("second/doBypass", self.Bypass.isChecked())
+        self.storeSetting("second/Delay", self.secondDelay.toPlainText())
+        self.storeSetting(
             "second/HighFlow", self.secondHighFlow.isChecked())
-        self.settings.setValue(
+        self.storeSetting(
             "second/LowFlow", self.secondLowFlow.isChecked())
-        self.settings.setValue(
+        self.storeSetting(
             "second/Polarity", self.secondPolarity.isChecked())
-        self.settings.setValue("second/ScanUpTime",
+        self.storeSetting("second/ScanUpTime",
                                self.secondScanUpTime.toPlainText())
-        self.settings.setValue(
+        self.storeSetting(
             "second/ScanDelay", self.scanDelay.toPlainText())
-        self.settings.setValue("second/ScanAve", self.scanAve.toPlainText())
-        self.settings.setValue("cpc/Type", self.cpcList.currentRow())
-        self.settings.setValue("cpc/IsEth", self.cpcIsEth.isChecked())
-        self.settings.setValue("cpc/IP", self.cpcIP.toPlainText())
-        self.settings.setValue("cpc/Port", self.cpcPort.toPlainText())
-        self.settings.setValue("average", self.average.toPlainText())
+        self.storeSetting("second/ScanAve", self.scanAve.toPlainText())
+        self.storeSetting("cpc/Type", self.cpcList.currentRow())
+        self.storeSetting("cpc/IsEth", self.cpcIsEth.isChecked())
+        self.storeSetting("cpc/IP", self.cpcIP.toPlainText())
+        self.storeSetting("cpc/Port", self.cpcPort.toPlainText())
+        self.storeSetting("average", self.average.toPlainText())
 
-        self.settings.setValue("RawFile", self.fileName)
+        self.storeSetting("RawFile", self.fileName)
+        self.settings.sync()
 
     def reset(self):
         if (QtWidgets.QMessageBox.question(self, "Tandem", "Do you want to return all settings to their defaults?", QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No) == QtWidgets.QMessageBox.Yes):
             self.settings.clear()
+            self.storedSettings.clear()
             self.getSettings()
 
     def closeEvent(self, event):
@@ -215,6 +265,14 @@ class Ui(QtWidgets.QMainWindow):  # main GUI object
         event.accept()  # let the window close
 
     def runScan(self):
+        try:  # read once per scan, before anything is connected or the log is opened
+            self.firstDelayTime = float(self.firstDelay.toPlainText())  # seconds
+            self.secondDelayTime = float(self.secondDelay.toPlainText())
+            self.averages = int(self.average.toPlainText())
+        except ValueError:
+            QtWidgets.QMessageBox.warning(
+                self, "Tandem Error", "Delays and averages must be numbers")
+            return
         if (os.path.isfile(self.fileName)):
             if (QtWidgets.QMessageBox.question(self, "Tandem", "Raw data file exists. Overwrite?", QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No) == QtWidgets.QMessageBox.No):
                 return
@@ -224,34 +282,15 @@ class Ui(QtWidgets.QMainWindow):  # main GUI object
         # Clear the existing plots
         self.plot.clear()
         self.plot2.clear()
-        if self.plot is not None and self.plot.get_legend() is not None:
-            self.plot.get_legend().remove()
-        # Adjust the layout to accommodate the legend outside the box
-        self.plotWidget.canvas.figure.tight_layout(
-            rect=[0, 0, 1, 1])  # Adjust the right margin
-        self.MplWidget.canvas.figure.tight_layout(
-            rect=[0.03, 0.03, 0.87, 1])   # Adjust the right margin
         self.graph.clear()
-        self.graph = self.plotWidget.canvas.ax
-        self.plot = self.MplWidget.canvas.ax
-        self.plot_live = self.MplWidget_live.canvas.ax
-        self.plot_live.set_xscale('log')
-        self.plot_live.set_xlabel('Second Classifier setpoints')
-        self.plot_live.set_ylabel('Particle Concentration [Counts]')
-        self.plot.set_xscale('log')
-        self.plot.set_xlabel('Second Classifier setpoints')
-        self.plot.set_ylabel('Particle Concentration [Counts]')
-        self.plot2.set_ylabel('Bypass Particle Concentration [Counts]')
-        self.graph.set_yscale('log')
-        self.graph.set_xscale('log')
-        self.graph.set_xlabel('First Classifier')
-        self.graph.set_ylabel('Second Classifier')
-        self.fig = self.graph.get_figure()  # Get the Figure object
+        self.mesh = None
+        self.setupAxes()
         self.stopButton.setEnabled(True)
         self.startButton.setEnabled(False)
         self.statusbar.showMessage("Initialising first classifier...")
         app.processEvents()
-        c = self.firstClassifierList.currentItem().text()
+        # classifier types for the whole scan, so the scan loop need not ask the lists again
+        c = self.firstType = self.firstClassifierList.currentItem().text()
         if (c == "AAC"):
             self.firstClass = instruments.AAC
         elif (c == "CPMA"):
@@ -277,7 +316,7 @@ class Ui(QtWidgets.QMainWindow):  # main GUI object
         app.processEvents()
         self.isScanner = False
         self.varBins = False
-        c = self.secondClassifierList.currentItem().text()
+        c = self.secondType = self.secondClassifierList.currentItem().text()
         if (c == "AAC"):
             self.isScanner = self.secondScanner.isChecked()
             self.varBins = self.variableBins.isChecked()
@@ -319,19 +358,7 @@ class Ui(QtWidgets.QMainWindow):  # main GUI object
             self.cpc = instruments.DummyCPC
         else:
             self.statusbar.showMessage("Initialising CPC...")
-            c = self.cpcList.currentItem().text()
-            if (c == "Cambustion 5210"):
-                self.cpc = instruments.CambustionCPC
-            elif (c == "3022/25"):
-                self.cpc = instruments.TSI30xx
-            elif (c == "3775/76"):
-                self.cpc = instruments.TSI377x
-            elif (c == "375x"):
-                self.cpc = instruments.TSI375x
-            elif (c == "Dummy"):
-                self.cpc = instruments.DummyCPC
-            elif (c == "Magic"):
-                self.cpc = instruments.MagicCpc
+            self.cpc = cpcTypes[self.cpcList.currentItem().text()]
 
         self.cpc = self.cpc(self.cpcIsSerial.isChecked(
         ), self.cpcIP.toPlainText(), self.cpcPort.toPlainText())
@@ -359,12 +386,14 @@ class Ui(QtWidgets.QMainWindow):  # main GUI object
             del self.cpc
             return
 
+        self.firstUnit = self.firstFromUnit.text()  # fixed for the scan, used in the plot labels
+        self.secondUnit = self.secondFromUnit.text()
         self.graph.set_xlabel(
-            f"{self.firstClass.label}[{self.firstFromUnit.text()}]")
+            f"{self.firstClass.label}[{self.firstUnit}]")
         self.graph.set_ylabel(
-            f"{self.secondClass.label}[{self.secondFromUnit.text()}]")
+            f"{self.secondClass.label}[{self.secondUnit}]")
         self.plot.set_xlabel(
-            f"{self.secondClass.label}[{self.secondFromUnit.text()}]")
+            f"{self.secondClass.label}[{self.secondUnit}]")
 
         if not (self.isScanner):
             self.plot.set_ylabel("Particle Concentration")
@@ -373,7 +402,7 @@ class Ui(QtWidgets.QMainWindow):  # main GUI object
             self.Z = np.zeros(
                 (self.firstClass.points, self.secondClass.points))
             self.G = np.zeros(self.secondClass.points)
-        elif (self.secondClassifierList.currentItem().text() == "AAC"):
+        elif (self.secondType == "AAC"):
             self.plot.set_ylabel("N [Counts]")
             self.X, self.Y = np.meshgrid(
                 self.firstClass.X, self.secondClass.X, indexing='ij')
@@ -381,18 +410,22 @@ class Ui(QtWidgets.QMainWindow):  # main GUI object
             self.G = np.zeros(1)
         else:
             self.plot.set_ylabel("N [Counts]")
+        self.formatAxes()
 
         # Create a colormap with a gradient from light to dark color
         light_color = np.array([0.0, 1.0, 0.0])
         dark_color = np.array([0.0, 0.0, 0.1])
         # Define the number of intermediate colors
         num_intermediate_colors = self.firstClass.points
-        # Create a list of colors by linear interpolation
-        colors = [light_color + (dark_color - light_color) * i /
-                  num_intermediate_colors for i in range(num_intermediate_colors + 1)]
+        # Create the colors by linear interpolation
+        colors = np.linspace(light_color, dark_color,
+                             num_intermediate_colors + 1)
         # Create a LinearSegmentedColormap
         self.cmap = mcolors.LinearSegmentedColormap.from_list(
             "custom_cmap", colors)
+        # colour of each first classifier point, ranging from 0 to 1 along the colormap
+        self.colors = self.cmap(
+            np.arange(self.firstClass.points) / self.firstClass.points).tolist()
         self.isScanning = True
         self.statusbar.showMessage("Scanning")
         self.timer = QTimer()
@@ -419,14 +452,30 @@ class Ui(QtWidgets.QMainWindow):  # main GUI object
         self.finalBypass = False
         self.firstBypass = True
         self.disBypass = True
+        self.afterDelay = None
+        self.liveLine = None  # live scatter of the current row, blitted while the row fills
+        self.row = 0  # counts first classifier rows, the live scatter restarts on each
+        self.liveRow = None
         self.timer.start(1)
 
+    def formatAxes(self):  # Set non-scientific notation for tick labels, once per scan
+        if (not (self.secondType == "3082 DMA" and self.isScanner)):
+            self.graph.xaxis.set_major_formatter(mpl.ticker.ScalarFormatter())
+            self.graph.yaxis.set_major_formatter(mpl.ticker.ScalarFormatter())
+            self.graph.xaxis.set_minor_formatter(mpl.ticker.ScalarFormatter())
+            self.graph.yaxis.set_minor_formatter(mpl.ticker.ScalarFormatter())
+            self.plot.xaxis.set_minor_formatter(mpl.ticker.ScalarFormatter())
+        self.plot.xaxis.set_major_formatter(mpl.ticker.ScalarFormatter())
+        self.plot.yaxis.set_major_formatter(mpl.ticker.ScalarFormatter())
+        self.plot.yaxis.set_minor_formatter(mpl.ticker.ScalarFormatter())
+        self.plot2.yaxis.set_major_formatter(mpl.ticker.ScalarFormatter())
+
     def startRawLog(self):
         self.file = open(self.fileName, 'w', newline='')
         self.file.write("Cambustion / University of Alberta\tTandem\tv"+version+"\t"+datetime.datetime.now(
         ).strftime("%Y-%m-%d%t%H:%M:%S")+"\tBypass scans:\t" + str(self.doBypass)+"\n")
         firstHeaders = self.firstClass.getHeader()
-        firstHeaders['Classifier 1'] = self.firstClassifierList.currentItem().text()
+        firstHeaders['Classifier 1'] = self.firstType
         firstHeaders['Data points'] = self.firstClass.points
         firstHeaders['Data length'] = len(self.firstClass.fileFields)
         self.writer = csv.DictWriter(self.file, fieldnames=['Classifier 1']+['Data points']+[
@@ -435,9 +484,8 @@ class Ui(QtWidgets.QMainWindow):  # main GUI object
         self.writer.writerow(firstHeaders)
 
         secondHeaders = self.secondClass.getHeader()
-        if (self.secondClassifierList.currentItem().text() == "3082 DMA" and self.secondScanner.isChecked()):
-            secondHeaders['Classifier 2'] = self.secondClassifierList.currentItem(
-            ).text()
+        if (self.secondType == "3082 DMA" and self.isScanner):
+            secondHeaders['Classifier 2'] = self.secondType
             secondHeaders['Start (nm)'] = self.secondLowerRange.itemText(
                 int(self.secondClass.LowerSizeRange()))
             secondHeaders['End (nm)'] = self.secondLowerRange.itemText(
@@ -447,8 +495,7 @@ class Ui(QtWidgets.QMainWindow):  # main GUI object
             self.writer.writeheader()
             self.writer.writerow(secondHeaders)
         else:
-            secondHeaders['Classifier 2'] = self.secondClassifierList.currentItem(
-            ).text()
+            secondHeaders['Classifier 2'] = self.secondType
             secondHeaders['Data points'] = self.secondClass.points
             secondHeaders['Data length'] = len(self.secondClass.fileFields)+1
             self.writer = csv.DictWriter(self.file, fieldnames=['Classifier 2']+['Data points']+[
@@ -468,61 +515,120 @@ class Ui(QtWidgets.QMainWindow):  # main GUI object
         self.writer.writeheader()
         self.fileData = {}
 
+    def delay(self, seconds, then):  # carry on with then() after seconds, leaving the GUI live
+        if (not self.isScanning):  # stopped while events were processed, nothing to carry on
+            return
+        self.afterDelay = then
+        self.timer.start(int(seconds*1000.0))
+
     def check(self):  # called every second to check readyness of classifiers
         self.timer.stop()
+        if (not self.isScanning):  # a stop queued behind this timeout
+            self.afterDelay = None
+            return
+        if (self.afterDelay is not None):
+            afterDelay, self.afterDelay = self.afterDelay, None
+            afterDelay()
+            return
 
         if (self.startRow):
             if (self.doBypass or self.firstClass.isReady()):
                 self.startRow = False
                 self.updateStatus("Delay 1")
-                for i in range(int(float(self.firstDelay.toPlainText())*10.0)):
-                    time.sleep(0.1)
-                    app.processEvents()
-                    if (not self.isScanning):
-                        return
-                # run the scanning 2nd classifier after first classifier is ready
-                if (self.isScanner):
-                    if (not self.doBypass):
-                        if (self.varBins):
-                            self.secondClass.VarDiameter(
-                                self.firstClass.X[self.firstClass.point])
-
-                        self.updateStatus("Scanning 2")
-                        self.secondClass.StartScan()
-                        if (self.secondClassifierList.currentItem().text() == "AAC"):
-                            if (not self.secondClass.isScanning):
-                                QtWidgets.QMessageBox.warning(self, "Tandem Error", "AAC scan error (range?)")
-                                self.endScan()
-                            self.secondClass.next()
+                self.delay(self.firstDelayTime, self.firstSettled)
             else:
                 self.updateStatus("Stabilising 1")
-                if (self.isScanner and self.secondClassifierList.currentItem().text() == "3082 DMA"):
+                if (self.isScanner and self.secondType == "3082 DMA"):
                     self.secondClass.StopScan()
-                self.timer.start(1)
+                self.timer.start(pollInterval)
+            return
+        self.checkSecond()
+
+    def firstSettled(self):
+        # run the scanning 2nd classifier after first classifier is ready
+        if (self.isScanner):
+            if (not self.doBypass):
+                if (self.varBins):
+                    if (not self.secondClass.VarDiameter(self.firstClass.X[self.firstClass.point])):
+                        self.barf(
+                            "Failed to set variable size bins. Reason: " + self.secondClass.lastResponse)
+                        return
+
+                self.updateStatus("Scanning 2")
+                self.secondClass.StartScan()
+                if (self.secondType == "AAC"):
+                    if (not self.secondClass.isScanning):
+                        QtWidgets.QMessageBox.warning(self, "Tandem Error", "AAC scan error (range?)")
+                        self.endScan()
+                    self.secondClass.next()
+        self.checkSecond()
+
+    def checkSecond(self):
+        # write the measured data to the file and start the next setpoint
+        if (self.secondClass.isReady()):
+            if (not (self.isScanner)):
+                self.updateStatus("Delay 2")
+                self.delay(self.secondDelayTime, self.secondSettled)
                 return
-        if (not self.startRow):
-            # write the measured data to the file and start the next setpoint
-            if (self.secondClass.isReady()):
-                self.timer.stop()
-                if (not (self.isScanner)):
-                    self.updateStatus("Delay 2")
-                    for i in range(int(float(self.secondDelay.toPlainText())*10.0)):
-                        time.sleep(0.1)
-                        app.processEvents()
-                        if (not self.isScanning):
-                            return
-                self.next()
-                if (not self.isScanning):
-                    return
-            else:
-                self.updateStatus("Stabilising 2")
-        self.timer.start(1)
+            self.secondSettled()
+        else:
+            self.updateStatus("Stabilising 2")
+            self.timer.start(pollInterval)
 
-    def next(self):
+    def secondSettled(self):
         self.plotIt()
-        if (not self.isScanning):
-            return
-        if (self.secondClassifierList.currentItem().text() == "3082 DMA" and self.secondScanner.isChecked()):
+        if (self.isScanning and self.afterDelay is None):
+            self.next()
+        self.carryOn()
+
+    def carryOn(self):  # go back to polling, unless waiting out a delay
+        if (self.isScanning and self.afterDelay is None):
+            self.timer.start(1)
+
+    def bypassStarted(self):  # pinch valve has settled for the first bypass
+        self.secondClass.StartScan()
+        if (self.secondType == "AAC"):
+            if (not self.secondClass.isScanning):
+                QtWidgets.QMessageBox.warning(self, "Tandem Error", "AAC scan error (range?)")
+                self.endScan()
+        self.firstBypass = False
+        if (self.isScanning):
+            self.secondSettled()
+
+    def bypassEnded(self):  # pinch valve has returned to normal scanning
+        self.next()
+        self.carryOn()
+
+    def finalBypassStarted(self):  # pinch valve has settled for the final bypass
+        if (self.secondType == "3082 DMA" and self.isScanner):
+            self.secondClass.StartScan()
+            self.nextRow()
+        else:
+            self.secondClass.run()
+            if (self.nextRow()):
+                self.nextPoint()
+        self.carryOn()
+
+    def nextRow(self):  # start the next first classifier setpoint
+        self.secondClass.reset()
+        self.fileData = {}
+        self.startRow = True
+        self.row += 1
+        if (not self.doBypass):
+            if (not self.firstClass.next()):
+                self.barf(
+                    "Failed to set first classifier. Reason: "+self.firstClass.lastResponse)
+                return False
+        return True
+
+    def nextPoint(self):  # step the second classifier, unless it scans itself
+        if (not self.isScanner):
+            if (not self.secondClass.next()):
+                self.barf(
+                    "Failed to set second classifier. Reason: " + self.secondClass.lastResponse)
+
+    def next(self):
+        if (self.secondType == "3082 DMA" and self.isScanner):
             if (self.secondClass.DataReady()):  # 2nd class processing have completed
                 if (self.doBypass):
                     self.doBypass = False
@@ -536,26 +642,12 @@ class Ui(QtWidgets.QMainWindow):  # main GUI object
                         self.disBypass = True
                         # self.firstClass.enableBypass(3)  # When using the analog output of the instrument
                         self.arduino.enableBypass()  # When using the Arduino
-
-                        for i in range(int(float(self.firstDelay.toPlainText())*10.0)):
-                            time.sleep(0.1)
-                        self.secondClass.StartScan()
-                        if (self.secondClassifierList.currentItem().text() == "AAC"):
-                            if (not self.secondClass.isScanning):
-                                QtWidgets.QMessageBox.warning(self, "Tandem Error", "AAC scan error (range?)")
-                                self.endScan()
-
-                self.secondClass.reset()
-                self.fileData = {}
-                self.startRow = True
-                if (not self.doBypass):
-                    if (not self.firstClass.next()):
-                        self.barf(
-                            "Failed to set first classifier. Reason: "+self.firstClass.lastResponse)
+                        self.delay(self.firstDelayTime, self.finalBypassStarted)
                         return
+                self.nextRow()
 
         else:
-            if (self.isScanner and self.secondClassifierList.currentItem().text() == "AAC"):
+            if (self.isScanner and self.secondType == "AAC"):
                 self.secondClass.next()
             if (not self.secondClass.moreToCome()):  # end of 2nd class sweep, end of file row
                 self.Scatterplot = True
@@ -565,32 +657,18 @@ class Ui(QtWidgets.QMainWindow):  # main GUI object
                     if (self.finalBypass or not self.Bypass.isChecked()):
                         # plot final step
                         self.plot.axes.plot(
-                            self.secondClass.X, self.G, label=f"{self.firstClass.label} = {round(self.firstClass.X[self.firstClass.point - 1], 2)} {self.firstFromUnit.text()}", color=self.color)
-                        self.plot.axes.legend(
-                            loc='upper left', fontsize='small')
+                            self.secondClass.X, self.G, label=f"{self.firstClass.label} = {round(self.firstClass.X[self.firstClass.point - 1], 2)} {self.firstUnit}", color=self.color)
                         # Combine legends from both plots and place it outside the plot area
                         legend_lines, legend_labels = self.plot.axes.get_legend_handles_labels()
                         legend_lines2, legend_labels2 = self.plot2.axes.get_legend_handles_labels()
                         combined_legend_lines = legend_lines + legend_lines2
                         combined_legend_labels = legend_labels + legend_labels2
-                        # remove the bypass legend
-                        if self.plot.get_legend():
-                            self.plot.get_legend().remove()
                         self.plot2.axes.legend(
                             combined_legend_lines, combined_legend_labels,
                             loc='upper left', bbox_to_anchor=(1.1, 1),
                             fontsize='small', frameon=False)
                         # self.plot.axes.set_title('Second Classifier Data')
-                        # Set non-scientific notation for x-axis tick labels
-                        self.plot.axes.xaxis.set_major_formatter(
-                            mpl.ticker.ScalarFormatter())
-                        self.plot.axes.yaxis.set_major_formatter(
-                            mpl.ticker.ScalarFormatter())
-                        self.plot.axes.yaxis.set_minor_formatter(
-                            mpl.ticker.ScalarFormatter())
-                        self.plot2.axes.yaxis.set_major_formatter(
-                            mpl.ticker.ScalarFormatter())
-                        self.MplWidget.canvas.draw()
+                        self.MplWidget.canvas.draw_idle()
                         self.endScan()
                         return
                     else:  # Final bypass starts
@@ -599,89 +677,70 @@ class Ui(QtWidgets.QMainWindow):  # main GUI object
                         self.disBypass = True
                         # self.firstClass.enableBypass(3)  # When using the Arduino
                         self.arduino.enableBypass()  # When using the Arduino
-                        for i in range(int(float(self.firstDelay.toPlainText())*10.0)):
-                            time.sleep(0.1)
-                        self.secondClass.run()
-
-                self.secondClass.reset()
-                self.fileData = {}
-                self.startRow = True
-                if (not self.doBypass):
-                    if (not self.firstClass.next()):
-                        self.barf(
-                            "Failed to set first classifier. Reason: "+self.firstClass.lastResponse)
+                        self.delay(self.firstDelayTime, self.finalBypassStarted)
                         return
-            if (not self.isScanner):
-                if (not self.secondClass.next()):
-                    self.barf(
-                        "Failed to set second classifier. Reason: " + self.secondClass.lastResponse)
+                if (not self.nextRow()):
                     return
+            self.nextPoint()
 
     def plotIt(self):  # do plot, and add data log row
-        if (self.isScanner and self.secondClassifierList.currentItem().text() == "AAC"):
-            self.G.resize(self.secondClass.points)
+        if (self.isScanner and self.secondType == "AAC"):
+            # grow the buffers only when the scan has found more points than before
+            if (self.G.size != self.secondClass.points):
+                self.G.resize(self.secondClass.points)
+            if (self.Z.shape != (self.firstClass.points, self.secondClass.points)):
+                self.Z.resize((self.firstClass.points, self.secondClass.points))
             self.X, self.Y = np.meshgrid(
                 self.firstClass.X, self.secondClass.X, indexing='ij')
-            self.Z.resize((self.firstClass.points, self.secondClass.points))
-        ave = int(self.average.toPlainText())
+        ave = self.averages
         self.updateStatus("Averaging")
+        if (not self.isScanning):  # stopped while the status was shown
+            return
         conc = 0.0
-        tzero = time.time()
-        # Calculate colour based on first classifer points
-        color_value = self.firstClass.point / \
-            (self.firstClass.points)  # Range from 0 to 1
-        self.color = self.cmap(color_value)
+        valveMoved = False
+        # colour based on first classifer point, the first one before the first classifier has started
+        self.color = self.colors[max(self.firstClass.point, 0)]
 
         # Stop the 2nd class # set the pinch valve for the bypass # Start the bypass
         if (self.doBypass and self.firstBypass):
             self.secondClass.StopScan()
             # self.firstClass.enableBypass(3)  # When using the analog output of the instrument
             self.arduino.enableBypass()  # When using Arduino
-            for i in range(int(float(self.firstDelay.toPlainText())*10.0)):
-                time.sleep(0.1)
-            self.secondClass.StartScan()
-            if (self.secondClassifierList.currentItem().text() == "AAC"):
-                if (not self.secondClass.isScanning):
-                    QtWidgets.QMessageBox.warning(self, "Tandem Error", "AAC scan error (range?)")
-                    self.endScan()
-            self.firstBypass = False
-        if (self.isScanner and self.secondClassifierList.currentItem().text() == "AAC"):
+            self.delay(self.firstDelayTime, self.bypassStarted)
+            return
+        if (self.isScanner and self.secondType == "AAC"):
             if (not self.doBypass):
                 self.firstClass.monitor()
         else:
             self.cpc.startpoll()
             for i in range(ave):
-                if (not self.isScanning):
-                    return
+                deadline = time.monotonic() + 1.0  # one sample per second
                 if (not self.doBypass):
                     self.firstClass.monitor()  # get feedback from classifier, add to average
-                app.processEvents()
-                if (not self.isScanning):
-                    return
                 self.secondClass.monitor()
-                app.processEvents()
                 conc += self.cpc.conc()  # CPC averaging handled here
-                while (time.time()-tzero < 1.0):
+                app.processEvents()  # once per sample, the Stop button is checked below
+                if (not self.isScanning):
+                    return
+                while (time.monotonic() < deadline):  # rest of the second, without pinning the CPU
+                    time.sleep(0.01)
                     app.processEvents()
                     if (not self.isScanning):
                         return
-                    tzero = time.time()
             self.cpc.endpoll()
             conc /= float(ave)
         # get fed back averages from classifer
         secData = self.secondClass.getFileData()
         for item, data in secData.items():
-            self.fileData[item + str(2)] = data
+            self.fileData[f"{item}2"] = data
 
-        if (not (self.secondClassifierList.currentItem().text() == "3082 DMA" and self.secondScanner.isChecked())):
+        if (not (self.secondType == "3082 DMA" and self.isScanner)):
             if (self.isScanner):
                 conc = self.secondClass.conc
             self.fileData["Conc "] = conc
             self.cpcNumber.display(conc)
             if (self.doBypass):
-                bypassDummy = {self.firstClass.fileFields[i]: "Bypassed" for i in range(
-                    len(self.firstClass.fileFields))}
-                self.fileData = {**self.fileData, **bypassDummy}
+                self.fileData.update(self.firstClass.bypassData)
                 # mapping the CPC data to the list G, and then plot the scatter
 
                 self.G[self.secondClass.point] = conc
@@ -694,184 +753,130 @@ class Ui(QtWidgets.QMainWindow):  # main GUI object
                                          label='Final Bypass', marker='x', linestyle='-')
                 self.plot2.axes.legend(loc='upper right',  fontsize='small')
             else:
-                self.fileData = {**self.fileData, **
-                                 self.firstClass.getFileData()}
+                self.fileData.update(self.firstClass.getFileData())
                 self.Z[self.firstClass.point, self.secondClass.point] = conc
                 # plot a contour
-                self.graph.axes.pcolor(
-                    self.X, self.Y, self.Z, shading='auto')
-                # # Set non-scientific notation for x-axis and y-axis tick labels
-                self.graph.axes.xaxis.set_major_formatter(
-                    mpl.ticker.ScalarFormatter())
-                self.graph.axes.yaxis.set_major_formatter(
-                    mpl.ticker.ScalarFormatter())
-                self.graph.axes.xaxis.set_minor_formatter(
-                    mpl.ticker.ScalarFormatter())
-                self.graph.axes.yaxis.set_minor_formatter(
-                    mpl.ticker.ScalarFormatter())
+                self.plotContour()
 
                 if (self.Scatterplot):
                     # plot a scatter
                     self.plot.axes.plot(self.secondClass.X, self.G,
-                                        label=f"{self.firstClass.label} = {round(self.firstClass.X[self.firstClass.point-1], 3)} {self.firstFromUnit.text()}", color=self.color)
-                    self.plot.axes.legend(loc='upper left', fontsize='small')
-                    # Set non-scientific notation for x-axis tick labels
-                    self.plot.axes.xaxis.set_major_formatter(
-                        mpl.ticker.ScalarFormatter())
-                    self.plot.axes.yaxis.set_major_formatter(
-                        mpl.ticker.ScalarFormatter())
-                    self.plot.axes.xaxis.set_minor_formatter(
-                        mpl.ticker.ScalarFormatter())
-                    self.plot.axes.yaxis.set_minor_formatter(
-                        mpl.ticker.ScalarFormatter())
+                                        label=f"{self.firstClass.label} = {round(self.firstClass.X[self.firstClass.point-1], 3)} {self.firstUnit}", color=self.color)
                     # Combine legends from both plots and place it outside the plot area
                     legend_lines, legend_labels = self.plot.axes.get_legend_handles_labels()
                     legend_lines2, legend_labels2 = self.plot2.axes.get_legend_handles_labels()
                     combined_legend_lines = legend_lines + legend_lines2
                     combined_legend_labels = legend_labels + legend_labels2
-                    # remove the bypass legend
-                    if self.plot.get_legend():
-                        self.plot.get_legend().remove()
                     self.plot2.axes.legend(
                         combined_legend_lines, combined_legend_labels,
                         loc='upper left', bbox_to_anchor=(1.04, 1),
                         fontsize='small', frameon=False)
                     # self.plot.axes.set_title('Second Classifier Data')
-                    self.MplWidget.canvas.draw()
-
-                    # Set non-scientific notation for x-axis tick labels
-                    self.plot_live.axes.xaxis.set_major_formatter(
-                        ScalarFormatter())
-                    # Adjust the layout to accommodate the legend outside the box
-                    self.MplWidget.canvas.figure.tight_layout(
-                        rect=[0, 0, 1, 1])   # Adjust the right margin
+                    self.MplWidget.canvas.draw_idle()
                     self.Scatterplot = False
-                    self.G = np.zeros(self.secondClass.points)
+                    self.G.fill(0.0)
 
                 # mapping the CPC data to the list G, and then plot the  scatter
                 self.G[self.secondClass.point] = conc
-                # Clear the existing live-plot
-                self.plot_live.clear()
-                # plot a live scatter
-                self.plot_live.set_xscale('log')
-                self.plot_live.set_xlabel(
-                    f"{self.secondClass.label}[{self.secondFromUnit.text()}]")
-                self.plot_live.set_ylabel("N [Counts]")
-                self.plot_live.axes.plot(self.secondClass.X, self.G,
-                                         label=f"{self.firstClass.label} = {round(self.firstClass.x, 2)} {self.firstFromUnit.text()}")
-                self.plot_live.axes.legend(loc='upper left', fontsize='small')
-                # Set non-scientific notation for x-axis tick labels
-                self.plot_live.axes.xaxis.set_major_formatter(
-                    mpl.ticker.ScalarFormatter())
-                self.plot_live.axes.xaxis.set_minor_formatter(
-                    mpl.ticker.ScalarFormatter())
-                self.plot_live.axes.yaxis.set_major_formatter(
-                    mpl.ticker.ScalarFormatter())
-                self.plot_live.axes.yaxis.set_minor_formatter(
-                    mpl.ticker.ScalarFormatter())
+                liveLabel = f"{self.firstClass.label} = {round(self.firstClass.x, 2)} {self.firstUnit}"
+                if (self.liveLine is None or self.liveRow != self.row):
+                    # new row: clear the existing live-plot and start a new live scatter
+                    self.plot_live.clear()
+                    self.plot_live.set_xscale('log')
+                    self.plot_live.set_xlabel(
+                        f"{self.secondClass.label}[{self.secondUnit}]")
+                    self.plot_live.set_ylabel("N [Counts]")
+                    self.liveLine, = self.plot_live.axes.plot(self.secondClass.X, self.G,
+                                                              label=liveLabel)
+                    self.liveRow = self.row
+                    self.plot_live.axes.legend(loc='upper left', fontsize='small')
+                    # Set non-scientific notation for x-axis tick labels
+                    self.plot_live.axes.xaxis.set_major_formatter(
+                        mpl.ticker.ScalarFormatter())
+                    self.plot_live.axes.xaxis.set_minor_formatter(
+                        mpl.ticker.ScalarFormatter())
+                    self.plot_live.axes.yaxis.set_major_formatter(
+                        mpl.ticker.ScalarFormatter())
+                    self.plot_live.axes.yaxis.set_minor_formatter(
+                        mpl.ticker.ScalarFormatter())
+                    # self.plot_live.axes.set_title('Second Classifier Live Data')
+                    self.MplWidget_live.canvas.draw_idle()
+                else:  # same row, only the live scatter changes
+                    self.MplWidget_live.canvas.updateLine(
+                        self.liveLine, self.secondClass.X, self.G)
                 # Draw the plot
                 self.plotWidget.canvas.draw_idle()
-                # Adjust the layout to prevent cutoff of axis labels
-                self.plotWidget.canvas.figure.tight_layout()
-
-            # Adjust the layout to accommodate the legend outside the box
-            self.plotWidget.canvas.figure.tight_layout(
-                rect=[0, 0, 1, 1])  # Adjust the right margin
-            # self.plot_live.axes.set_title('Second Classifier Live Data')
-            self.MplWidget_live.canvas.draw()
-            # Adjust the layout to prevent cutoff of axis labels
-            self.MplWidget_live.canvas.figure.tight_layout()
 
             self.writer.writerow(self.fileData)  # commit log row to file
 
         # If the 2nd class is DMA-3082 and the scanning is done, commit log row to file
-        elif (self.secondClassifierList.currentItem().text() == "3082 DMA" and self.secondScanner.isChecked()):
-            # Get rid of Scientific notation
-            self.plot.axes.xaxis.set_major_formatter(
-                mpl.ticker.ScalarFormatter())
-            self.plot.axes.yaxis.set_major_formatter(
-                mpl.ticker.ScalarFormatter())
-            self.plot.axes.yaxis.set_minor_formatter(
-                mpl.ticker.ScalarFormatter())
-            self.plot2.axes.yaxis.set_major_formatter(
-                mpl.ticker.ScalarFormatter())
+        elif (self.secondType == "3082 DMA" and self.isScanner):
             if (self.secondClass.DataReady()):
-                LowerSizeRange = self.secondClass.LowerSizeRange()
-                UpperSizeRange = self.secondClass.UpperSizeRange()
-                Conc_3082 = self.secondClass.output3082()
-                conc3082 = {}
-                # set the concentration of 3082,
-                conc3082 = {i: Conc_3082[i] for i in range(193)}
-                for i in range(int(LowerSizeRange), int(UpperSizeRange)):
+                LowerSizeRange = int(self.secondClass.LowerSizeRange())
+                UpperSizeRange = int(self.secondClass.UpperSizeRange())
+                # concentrations of the 3082 size bins in range, offset by one in its output
+                conc3082 = self.secondClass.output3082()[LowerSizeRange+1:UpperSizeRange+1]
+                # first classifier columns are the same for every size bin
+                if (self.doBypass):
+                    self.fileData.update(self.firstClass.bypassData)
+                    if (self.disBypass):  # return the pinch valve to  normal scanning
+                        # self.firstClass.disableBypass(3)  # When using the analog output of the instrument
+
+                        self.arduino.disableBypass()  # When using Arduino
+                        self.disBypass = False
+                        valveMoved = True
+                else:
+                    self.fileData.update(self.firstClass.getFileData())
+                for i in range(LowerSizeRange, UpperSizeRange):
                     self.fileData["Dm (nm)2"] = self.secondLowerRange.itemText(
                         i)   # read the textvalue of particle diameter
-                    self.fileData["Conc "] = conc3082[i+1]
-                    if (self.doBypass):
-                        bypassDummy = {self.firstClass.fileFields[i]: "Bypassed" for i in range(
-                            len(self.firstClass.fileFields))}
-                        self.fileData = {**self.fileData, **bypassDummy}
-                        if (self.disBypass):  # return the pinch valve to  normal scanning
-                            # self.firstClass.disableBypass(3)  # When using the analog output of the instrument
-
-                            self.arduino.disableBypass()  # When using Arduino
-                            for i in range(int(float(self.firstDelay.toPlainText())*10.0)):
-                                time.sleep(0.1)
-                            self.disBypass = False
-                    else:
-                        self.fileData = {**self.fileData, **
-                                         self.firstClass.getFileData()}
+                    self.fileData["Conc "] = conc3082[i-LowerSizeRange]
                     # commit log row to file
                     self.writer.writerow(self.fileData)
 
-                if self.makesecondClassX:  # making 3082 DMA points as an array
-                    self.secondClassX = np.array([float(self.secondLowerRange.itemText(
-                        i)) for i in range(int(LowerSizeRange), int(UpperSizeRange))])
+                # making 3082 DMA points as an array, again only if the size range has changed
+                if (self.makesecondClassX or self.sizeRange3082 != (LowerSizeRange, UpperSizeRange)):
+                    self.sizeRange3082 = (LowerSizeRange, UpperSizeRange)
+                    self.secondClassX = np.fromiter((self.secondLowerRange.itemText(i) for i in range(
+                        LowerSizeRange, UpperSizeRange)), dtype=float, count=UpperSizeRange-LowerSizeRange)
                     self.Z = np.zeros(
                         (self.firstClass.points, self.secondClassX.shape[0]))
                     self.z = np.zeros(self.secondClassX.shape[0])
-                    # self.makesecondClassX = False
-                # self.z = np.zeros(self.secondClassX.shape[0])
-                self.X, self.Y = np.meshgrid(
-                    self.firstClass.X, self.secondClassX, indexing='ij')
+                    self.X, self.Y = np.meshgrid(
+                        self.firstClass.X, self.secondClassX, indexing='ij')
+                    self.makesecondClassX = False
+                else:
+                    self.Z.fill(0.0)  # each spectrum starts a fresh contour
 
                 # mapping the CPC data to the matrix Z and list z, and then plot the contour and scatter, respectively
-                j = 0
-
-                for i in range(int(LowerSizeRange), int(UpperSizeRange)):
-                    self.Z[self.firstClass.point, j] = conc3082[i+1]
-                    self.z[j] = conc3082[i+1]
-                    j += 1
+                self.z[:] = np.asarray(conc3082, dtype=float)
+                self.Z[self.firstClass.point] = self.z
                 if (not self.doBypass):
                     # plot a contour
-                    self.graph.axes.pcolor(
-                        self.X, self.Y, self.Z, shading='auto')
+                    self.plotContour()
 
                     # plot a scatter
                     self.plot.axes.plot(self.secondClassX, self.z,
-                                        label=f"{self.firstClass.label} = {round(self.firstClass.x, 3)} {self.firstFromUnit.text()}", color=self.color)
-                    self.plot.axes.legend(loc='upper left', fontsize='small')
+                                        label=f"{self.firstClass.label} = {round(self.firstClass.x, 3)} {self.firstUnit}", color=self.color)
 
                     # Clear the existing live-plot
                     self.plot_live.clear()
                     self.plot_live.set_xscale('log')
                     # plot a live scatter
                     self.plot_live.set_xlabel(
-                        f"{self.secondClass.label}[{self.secondFromUnit.text()}]")
+                        f"{self.secondClass.label}[{self.secondUnit}]")
                     self.plot_live.set_ylabel("N [Counts]")
                     self.plot_live.axes.plot(self.secondClassX, self.z,
-                                             label=f"{self.firstClass.label} = {round(self.firstClass.x, 3)} {self.firstFromUnit.text()}")
+                                             label=f"{self.firstClass.label} = {round(self.firstClass.x, 3)} {self.firstUnit}")
                     self.plot_live.axes.legend(
                         loc='upper left', fontsize='small')
                     # Draw the plot
                     self.plotWidget.canvas.draw_idle()
-                    # Adjust the layout to prevent cutoff of axis labels
-                    self.plotWidget.canvas.figure.tight_layout()
 
                 else:  # plot ByPass results
                     if (not self.finalBypass):
                         # self.plot2.clear()
-                        self.Z = np.zeros(
-                            (self.firstClass.points, self.secondClassX.shape[0]))
+                        self.Z.fill(0.0)
                         self.plot2.axes.plot(self.secondClassX, self.z,
                                              label='First Bypass', marker='x', linestyle='-')
                     else:
@@ -881,53 +886,46 @@ class Ui(QtWidgets.QMainWindow):  # main GUI object
                         loc='upper right',  fontsize='small')
 
                 # Set non-scientific notation for x-axis tick labels
-                self.plot.axes.xaxis.set_major_formatter(ScalarFormatter())
                 self.plot_live.axes.xaxis.set_major_formatter(
                     ScalarFormatter())
 
-                # Get rid of Scientific notation
-
                 # Combine legends from both plots and place it outside the plot area
                 legend_lines, legend_labels = self.plot.axes.get_legend_handles_labels()
                 legend_lines2, legend_labels2 = self.plot2.axes.get_legend_handles_labels()
 
                 combined_legend_lines = legend_lines + legend_lines2
                 combined_legend_labels = legend_labels + legend_labels2
-                # remove the bypass legend
-                if self.plot.get_legend():
-                    self.plot.get_legend().remove()
                 self.plot2.axes.legend(
                     combined_legend_lines, combined_legend_labels,
                     loc='upper left', bbox_to_anchor=(1.1, 1),
                     fontsize='small', frameon=False)
-
-                # Get rid of Scientific notation
-                self.plot.axes.xaxis.set_major_formatter(
-                    mpl.ticker.ScalarFormatter())
-                self.plot.axes.yaxis.set_major_formatter(
-                    mpl.ticker.ScalarFormatter())
-                self.plot.axes.yaxis.set_minor_formatter(
-                    mpl.ticker.ScalarFormatter())
-                self.plot2.axes.yaxis.set_major_formatter(
-                    mpl.ticker.ScalarFormatter())
-                self.MplWidget.canvas.draw()
-
-                # Adjust the layout to accommodate the legend outside the box
-                self.plotWidget.canvas.figure.tight_layout()  # Adjust the right margin
-                self.MplWidget.canvas.figure.tight_layout()   # Adjust the right margin
+                self.MplWidget.canvas.draw_idle()
 
                 # self.plot.axes.set_title('Second Classifier Data')
                 # self.plot_live.axes.set_title('Second Classifier Live Data')
 
-                self.MplWidget_live.canvas.draw()
-                # Adjust the layout to prevent cutoff of axis labels
-                self.MplWidget_live.canvas.figure.tight_layout()
+                self.MplWidget_live.canvas.draw_idle()
 
         self.updateStatus()
+        if (valveMoved):  # let the pinch valve settle before the next row
+            self.delay(self.firstDelayTime, self.bypassEnded)
+
+    def plotContour(self):  # reuse the contour mesh unless its grid has changed
+        if (self.mesh is not None and self.mesh.get_array().shape == self.Z.shape
+                and np.array_equal(self.meshX, self.X) and np.array_equal(self.meshY, self.Y)):
+            self.mesh.set_array(self.Z)
+            self.mesh.autoscale()
+            return
+        if (self.mesh is not None):
+            self.mesh.remove()
+        self.mesh = self.graph.axes.pcolormesh(
+            self.X, self.Y, self.Z, shading='auto')
+        self.meshX = self.X
+        self.meshY = self.Y
 
     def updateStatus(self, message=None):
         if (message != None):
-            message = " : "+message
+            message = f" : {message}"
         else:
             message = ""
         if (self.isScanner):
@@ -935,14 +933,14 @@ class Ui(QtWidgets.QMainWindow):  # main GUI object
                 self.statusbar.showMessage("Bypass scan: ")
             else:
                 self.statusbar.showMessage(
-                    "Scanning: "+str(self.firstClass.point+1)+"/"+str(self.firstClass.points)+message)
+                    f"Scanning: {self.firstClass.point+1}/{self.firstClass.points}{message}")
         else:
             if (self.doBypass):
                 self.statusbar.showMessage(
-                    "Bypass scan: "+str(self.secondClass.point+1)+"/"+str(self.secondClass.points)+message)
+                    f"Bypass scan: {self.secondClass.point+1}/{self.secondClass.points}{message}")
             else:
-                self.statusbar.showMessage("Scanning: "+str(self.firstClass.point+1)+"/"+str(
-                    self.firstClass.points)+" & "+str(self.secondClass.point+1)+"/"+str(self.secondClass.points)+message)
+                self.statusbar.showMessage(
+                    f"Scanning: {self.firstClass.point+1}/{self.firstClass.points} & {self.secondClass.point+1}/{self.secondClass.points}{message}")
         app.processEvents()
 
     def barf(self, message):
@@ -1141,7 +1139,7 @@ class Ui(QtWidgets.QMainWindow):  # main GUI object
             self.cpcPort.setEnabled(self.cpcIsSerial.isChecked())
 
     def secondScanChanged(self, c):
-
+        classifier = self.secondClassifierList.currentItem().text()
         if (c):
             self.secondHighFlow.setDisabled(True)
             self.secondLowFlow.setDisabled(True)
@@ -1160,7 +1158,7 @@ class Ui(QtWidgets.QMainWindow):  # main GUI object
             self.secondFrom.setVisible(True)
             self.secondTo.setVisible(True)
 
-            if (self.secondClassifierList.currentItem().text() == "3082 DMA" or self.secondClassifierList.currentItem().text() == "AAC"):
+            if (classifier in ("3082 DMA", "AAC")):
                 self.variableBins.setEnabled(True)
                 self.secondFrom.setDisabled(False)
                 self.secondTo.setDisabled(False)
@@ -1170,7 +1168,7 @@ class Ui(QtWidgets.QMainWindow):  # main GUI object
                 self.secondFrom.setDisabled(True)
                 self.secondTo.setDisabled(True)
 
-            if (self.secondClassifierList.currentItem().text() == "3082 DMA"):
+            if (classifier == "3082 DMA"):
                 self.secondHighFlow.setDisabled(False)
                 self.secondLowFlow.setDisabled(False)
                 self.secondFrom.setVisible(False)
@@ -1220,12 +1218,13 @@ class Ui(QtWidgets.QMainWindow):  # main GUI object
             self.mobilityDiameterBox.setEnabled(False)
 
     def SecondBinsChanged(self, c):
+        classifier = self.secondClassifierList.currentItem().text()
         if (c):
             self.mobilityDiameterBox.setEnabled(True)
             self.secondFrom.setEnabled(True)
             self.secondTo.setEnabled(True)
 
-            if (self.secondClassifierList.currentItem().text() == "3082 DMA" or self.secondClassifierList.currentItem().text() == "AAC"):
+            if (classifier in ("3082 DMA", "AAC")):
                 self.secondFrom.setDisabled(True)
                 self.secondTo.setDisabled(True)
                 self.secondLowerRange.setDisabled(True)
@@ -1259,51 +1258,49 @@ class Ui(QtWidgets.QMainWindow):  # main GUI object
             self.mobilityDiameterBox.setEnabled(False)
             self.secondFrom.setEnabled(True)
             self.secondTo.setEnabled(True)
-            if (self.secondClassifierList.currentItem().text() == "3082 DMA"):
+            if (classifier == "3082 DMA"):
                 self.secondLowerRange.setDisabled(False)
                 self.secondUpperRange.setDisabled(False)
 
-    def selectFile(self):
-        self.fileName, _ = QtWidgets.QFileDialog.getSaveFileName(
-            self, "Log to", "", "Text Files (*.txt)")
-        self.rawFileDisplay.setText("Raw Data File: "+self.fileName)
+    def selectFile(self):  # window-modal, so a running scan keeps going while the dialog is up
+        dialog = QtWidgets.QFileDialog(self, "Log to", "", "Text Files (*.txt)")
+        dialog.setAcceptMode(QtWidgets.QFileDialog.AcceptSave)
+        dialog.setAttribute(Qt.WA_DeleteOnClose)
+        dialog.fileSelected.connect(self.fileSelected)
+        dialog.open()
+
+    def fileSelected(self, fileName):
+        self.fileName = fileName
+        self.rawFileDisplay.setText(f"Raw Data File: {self.fileName}")
 
     def getFileFields(self):
-        secFields = []
-        secFields = [field + str(2)
-                     for field in self.secondClass.fileFields]+["Conc "]
+        secFields = [f"{field}2" for field in self.secondClass.fileFields]+["Conc "]
         # note we _prepend_ the firstClass headers. This will set the order in the file.
         return self.firstClass.fileFields+secFields
 
     def testCPC(self):
-        self.statusbar.showMessage("Initialising CPC...")
-        c = self.cpcList.currentItem().text()
-        if (c == "Cambustion 5210"):
-            self.cpc = instruments.CambustionCPC
-        elif (c == "3022/25"):
-            self.cpc = instruments.TSI30xx
-        elif (c == "3775/76"):
-            self.cpc = instruments.TSI377x
-        elif (c == "375x"):
-            self.cpc = instruments.TSI375x
-        elif (c == "Dummy"):
-            self.cpc = instruments.DummyCPC
-        elif (c == "Magic"):
-            self.cpc = instruments.MagicCpc
-
-        self.cpc = self.cpc(self.cpcIsSerial.isChecked(), self.cpcIP.toPlainText(), self.cpcPort.toPlainText())
-
-        if (not self.cpc.connected):
-            self.barf("Connection Error to CPC")
-            del self.cpc
+        if (self.cpcProbe is not None):  # one test at a time, they would share the port
             return
+        self.statusbar.showMessage("Initialising CPC...")
+        self.testCPCbutton.setEnabled(False)
+        probe = CpcProbe(cpcTypes[self.cpcList.currentItem().text()],
+                         self.cpcIsSerial.isChecked(), self.cpcIP.toPlainText(), self.cpcPort.toPlainText())
+        self.cpcProbe = probe.signals  # keep the signals alive until the probe is done
+        probe.signals.conc.connect(self.cpcNumber.display)
+        probe.signals.failed.connect(self.cpcProbeFailed)
+        probe.signals.done.connect(self.cpcProbeDone)
+        QThreadPool.globalInstance().start(probe)
+
+    def cpcProbeFailed(self):
+        self.statusbar.clearMessage()
+        QtWidgets.QMessageBox.warning(self, "Tandem Error", "Connection Error to CPC")
 
-        self.cpcNumber.display(self.cpc.conc())
-
-        self.cpc.disconnect()
+    def cpcProbeDone(self):
+        self.testCPCbutton.setEnabled(True)
+        self.cpcProbe = None
 
-    def invert(self):
-        self.barf("Inversion feature not implemented yet.")
+    def invert(self):  # not a scan error, so leave any running scan alone
+        QtWidgets.QMessageBox.information(self, "Tandem", "Inversion feature not implemented yet.")
         
 
 app.setApplicationName("Tandem")